@@ -1,12 +1,131 @@
+import inspect
+import sys
+import threading
 from contextvars import ContextVar
-from functools import wraps
-from uuid import uuid4
+from functools import lru_cache, wraps
+from itertools import count
 from django.db import connections
 
+# Database aliases are interned, so checking whether a context variable already
+# holds an alias is an identity comparison
+_DEFAULT_ALIAS = sys.intern('default')
+
 # Define context variables for read and write database settings
 # These variables will maintain database preferences per context
-DB_FOR_READ_OVERRIDE = ContextVar('DB_FOR_READ_OVERRIDE', default='default')
-DB_FOR_WRITE_OVERRIDE = ContextVar('DB_FOR_WRITE_OVERRIDE', default='default')
+DB_FOR_READ_OVERRIDE = ContextVar('DB_FOR_READ_OVERRIDE', default=_DEFAULT_ALIAS)
+DB_FOR_WRITE_OVERRIDE = ContextVar('DB_FOR_WRITE_OVERRIDE', default=_DEFAULT_ALIAS)
+
+# Bound accessors for the context variables, resolved once at import time so
+# the router and context manager hot paths skip the attribute lookup per call
+_READ_GET = DB_FOR_READ_OVERRIDE.get
+_READ_SET = DB_FOR_READ_OVERRIDE.set
+_READ_RESET = DB_FOR_READ_OVERRIDE.reset
+_WRITE_GET = DB_FOR_WRITE_OVERRIDE.get
+_WRITE_SET = DB_FOR_WRITE_OVERRIDE.set
+_WRITE_RESET = DB_FOR_WRITE_OVERRIDE.reset
+
+# Reset tokens of the in_database blocks entered in the current context, as nested
+# (tokens, previous) pairs. Keeping them per context rather than on the instance
+# lets one instance be entered concurrently from several threads or tasks.
+_ENTERED = ContextVar('_ENTERED', default=None)
+_ENTERED_GET = _ENTERED.get
+_ENTERED_SET = _ENTERED.set
+
+_BAD_TYPE_MSG = 'database must be an identifier (str) for an existing db, or a complete configuration (dict).'
+
+# Process-unique suffixes for the aliases of dynamically configured databases
+_ID_COUNTER = count().__next__
+
+# Aliases of dynamically configured databases, keyed by their frozen configuration,
+# so that identical configurations share one alias and its persistent connection
+_CONFIG_CACHE: dict[frozenset, str] = {}
+
+# Aliases of dynamically configured databases that could not be cached, because
+# their configuration holds unhashable values
+_UNCACHED_DB_IDS: list[str] = []
+
+# Serialises registration of dynamic aliases in this module, so that each cached
+# configuration maps to exactly one alias. Django's own readers of
+# ``connections.databases``, such as ``connections.all()``, do not take this lock.
+_DB_REGISTRY_LOCK = threading.Lock()
+
+
+def _override(database, read, write):
+    """
+    Route reads and/or writes to ``database``, returning the tokens to reset.
+
+    Context variables that already hold ``database`` are left untouched and
+    get a ``None`` token.
+    """
+    read_token = _READ_SET(database) if read and _READ_GET() is not database else None
+    write_token = _WRITE_SET(database) if write and _WRITE_GET() is not database else None
+    return read_token, write_token
+
+
+def _reset(read_token, write_token):
+    """
+    Undo an ``_override`` given the tokens it returned.
+    """
+    if read_token is not None:
+        _READ_RESET(read_token)
+    if write_token is not None:
+        _WRITE_RESET(write_token)
+
+
+def _freeze(value):
+    """
+    Convert a database configuration value into a hashable equivalent.
+    """
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+def _copy_config(database):
+    """
+    Copy a database configuration along with its nested ``OPTIONS`` and ``TEST``
+    dicts, keeping the values inside them as they are.
+    """
+    config = dict(database)
+    for key in ('OPTIONS', 'TEST'):
+        if isinstance(config.get(key), dict):
+            config[key] = dict(config[key])
+    return config
+
+
+def _register_config(database):
+    """
+    Return the alias for a database configuration, and whether this call registered it.
+    """
+    try:
+        key = _freeze(database)
+    except TypeError:
+        # A configuration with unhashable values cannot be cached, so it gets a
+        # fresh alias on every use
+        key = None
+
+    unique_db_id = _CONFIG_CACHE.get(key)
+    if unique_db_id is not None:
+        return unique_db_id, False
+
+    with _DB_REGISTRY_LOCK:
+        unique_db_id = _CONFIG_CACHE.get(key)
+        if unique_db_id is not None:
+            return unique_db_id, False
+
+        unique_db_id = sys.intern(f'__dyn_db_{_ID_COUNTER()}')
+        # Register a copy, so later edits to the caller's dict (or Django filling
+        # in defaults) cannot drift from the cache key
+        connections.databases[unique_db_id] = _copy_config(database)
+        if key is None:
+            _UNCACHED_DB_IDS.append(unique_db_id)
+        else:
+            _CONFIG_CACHE[key] = unique_db_id
+    return unique_db_id, True
 
 
 class DynamicDbRouter:
@@ -14,22 +133,31 @@ class DynamicDbRouter:
     A router that dynamically determines which database to perform read and write operations
     on based on the current execution context. It supports both synchronous and asynchronous code.
     """
-    
-    def db_for_read(self, model, **hints):
-        return DB_FOR_READ_OVERRIDE.get()
+    __slots__ = ()
 
-    def db_for_write(self, model, **hints):
-        return DB_FOR_WRITE_OVERRIDE.get()
+    # None of the answers depend on the router instance, so they are static
+    # methods and skip the bound method creation on each call
+    @staticmethod
+    def db_for_read(model, **hints):
+        return _READ_GET()
 
-    def allow_relation(self, *args, **kwargs):
+    @staticmethod
+    def db_for_write(model, **hints):
+        return _WRITE_GET()
+
+    @staticmethod
+    def allow_relation(*args, **kwargs):
         return True
 
-    def allow_syncdb(self, *args, **kwargs):
+    @staticmethod
+    def allow_syncdb(*args, **kwargs):
         return None
 
-    def allow_migrate(self, *args, **kwargs):
+    @staticmethod
+    def allow_migrate(*args, **kwargs):
         return None
 
+
 class in_database:
     """
     A decorator and context manager to do queries on a given database.
@@ -68,51 +196,119 @@ class in_database:
         with in_database(db_config):
             # Run queries
     """
+    __slots__ = ('read', 'write', 'database', 'created_db_config', 'unique_db_id')
+
     def __init__(self, database: str | dict, read=True, write=False):
         self.read = read
         self.write = write
-        self.database = database
         self.created_db_config = False
+        self.unique_db_id = None
 
-        # Handle database parameter either as a string (alias) or as a dict (configuration)
-        if isinstance(database, str):
-            self.database = database
-        elif isinstance(database, dict):
-            # If it's a dict, create a unique database configuration
-            self.created_db_config = True
-            self.unique_db_id = str(uuid4())
-            connections.databases[self.unique_db_id] = database
+        # A plain string alias is by far the most common case, so it returns
+        # before any of the configuration handling below
+        if type(database) is str:
+            self.database = sys.intern(database)
+            return
+
+        # Handle database parameter either as a dict (configuration) or a str subclass (alias)
+        if isinstance(database, dict):
+            # If it's a dict, reuse the alias of an identical configuration or
+            # register a new unique one
+            self.unique_db_id, self.created_db_config = _register_config(database)
             self.database = self.unique_db_id
+        elif isinstance(database, str):
+            self.database = sys.intern(str(database))
         else:
-            raise ValueError("database must be an identifier (str) for an existing db, "
-                             "or a complete configuration (dict).")
+            raise ValueError(_BAD_TYPE_MSG)
 
     def __enter__(self):
-        # Capture the current database settings
-        self.original_read_db = DB_FOR_READ_OVERRIDE.get()
-        self.original_write_db = DB_FOR_WRITE_OVERRIDE.get()
-
         # Override the database settings for the duration of the context
-        if self.read:
-            DB_FOR_READ_OVERRIDE.set(self.database)
-        if self.write:
-            DB_FOR_WRITE_OVERRIDE.set(self.database)
+        _ENTERED_SET((_override(self.database, self.read, self.write), _ENTERED_GET()))
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        # Restore the original database settings after the context.
-        DB_FOR_READ_OVERRIDE.set(self.original_read_db)
-        DB_FOR_WRITE_OVERRIDE.set(self.original_write_db)
-        
-        # Close and delete created database configuration
-        if self.created_db_config:
-            connections[self.unique_db_id].close()
-            del connections.databases[self.unique_db_id]
+        # Restore the original database settings after the context. Dynamic
+        # configurations stay registered so their connection can be reused,
+        # and Django closes it according to ``CONN_MAX_AGE``.
+        self._restore()
+
+    async def __aenter__(self):
+        # Entering only touches context variables, so no I/O is awaited here
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._restore()
+
+    def _restore(self):
+        tokens, previous = _ENTERED_GET()
+        _ENTERED_SET(previous)
+        _reset(*tokens)
+
+    @classmethod
+    def purge_cache(cls):
+        """
+        Close and unregister every dynamically configured database.
+
+        Django connections are local to a thread, so only the connections opened
+        by the calling thread are closed. Other threads' connections are left to
+        Django's own ``CONN_MAX_AGE`` handling.
+        """
+        with _DB_REGISTRY_LOCK:
+            unique_db_ids = list(_CONFIG_CACHE.values()) + _UNCACHED_DB_IDS
+            _CONFIG_CACHE.clear()
+            _UNCACHED_DB_IDS.clear()
+
+        # The lock is only held for the registry writes, not while closing
+        for unique_db_id in unique_db_ids:
+            connections[unique_db_id].close()
+            del connections[unique_db_id]
+            with _DB_REGISTRY_LOCK:
+                del connections.databases[unique_db_id]
+
+    @classmethod
+    def for_alias(cls, alias: str, read=True, write=False):
+        """
+        Return a shared decorator routing to an alias in ``django.conf.settings.DATABASES``.
+
+        Functions decorated for the same alias and flags reuse one ``in_database``.
+        Only its decorator is handed out; use ``in_database`` itself as a context
+        manager.
+        """
+        return _shared_in_database(alias, read, write)
 
     def __call__(self, querying_func):
-        # Allow the object to be used as a decorator
+        # Allow the object to be used as a decorator. The decorator instance is
+        # shared by every call of the decorated function, so the context tokens
+        # are kept local to each call rather than stored on ``self``.
+        database = self.database
+        read = self.read
+        write = self.write
+
+        # Nothing is routed when both reads and writes are disabled, so the
+        # function is returned as is rather than wrapped
+        if not read and not write:
+            return querying_func
+
+        if inspect.iscoroutinefunction(querying_func):
+            @wraps(querying_func)
+            async def ainner(*args, **kwargs):
+                tokens = _override(database, read, write)
+                try:
+                    return await querying_func(*args, **kwargs)
+                finally:
+                    _reset(*tokens)
+            return ainner
+
         @wraps(querying_func)
         def inner(*args, **kwargs):
-            with self:
+            tokens = _override(database, read, write)
+            try:
                 return querying_func(*args, **kwargs)
+            finally:
+                _reset(*tokens)
         return inner
+
+
+@lru_cache(maxsize=256)
+def _shared_in_database(alias, read, write):
+    return in_database(alias, read, write).__call__
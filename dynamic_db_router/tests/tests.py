@@ -1,11 +1,16 @@
+import asyncio
 import os
 import sqlite3
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from django.db import connections
 from django.test import TestCase
 from django_dynamic_fixture import G
+from mock import patch
 
-from dynamic_db_router import DynamicDbRouter, in_database
+from dynamic_db_router import DynamicDbRouter, in_database, router as router_module
 from .models import TestModel
 
 
@@ -51,11 +56,78 @@ class TestInDataBaseContextManager(TestCase):
             test_count = TestModel.objects.count()
         self.assertEqual(test_count, 1)
 
+    def test_nested_same_database_restores_outer(self):
+        router = DynamicDbRouter()
+        with in_database('test', write=True):
+            with in_database('test', write=True):
+                pass
+            self.assertEqual(router.db_for_read(None), 'test')
+            self.assertEqual(router.db_for_write(None), 'test')
+        self.assertEqual(router.db_for_read(None), 'default')
+        self.assertEqual(router.db_for_write(None), 'default')
+
+    def test_restores_after_exception(self):
+        router = DynamicDbRouter()
+        with self.assertRaises(RuntimeError):
+            with in_database('test', write=True):
+                raise RuntimeError
+        self.assertEqual(router.db_for_read(None), 'default')
+        self.assertEqual(router.db_for_write(None), 'default')
+
+    def test_str_subclass_identifier(self):
+        class Alias(str):
+            pass
+
+        router = DynamicDbRouter()
+        with in_database(Alias('test')) as x:
+            self.assertIs(type(x.database), str)
+            self.assertEqual(router.db_for_read(None), 'test')
+
+    def test_shared_instance_nested(self):
+        router = DynamicDbRouter()
+        shared = in_database('test', write=True)
+        with shared:
+            with in_database('default', write=True):
+                with shared:
+                    self.assertEqual(router.db_for_write(None), 'test')
+                self.assertEqual(router.db_for_write(None), 'default')
+            self.assertEqual(router.db_for_write(None), 'test')
+        self.assertEqual(router.db_for_write(None), 'default')
+
+    def test_shared_instance_across_threads(self):
+        router = DynamicDbRouter()
+        shared = in_database('test', write=True)
+        entered = threading.Barrier(2)
+
+        def routed_dbs(_):
+            with shared:
+                entered.wait()
+                routed = router.db_for_read(None), router.db_for_write(None)
+                entered.wait()
+            return routed, (router.db_for_read(None), router.db_for_write(None))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(routed_dbs, range(2)))
+        self.assertEqual(results, [(('test', 'test'), ('default', 'default'))] * 2)
+
     def test_bad_input_value(self):
         with self.assertRaises(ValueError):
             with in_database(2):
                 pass
 
+    def test_subclass(self):
+        class routed(in_database):
+            pass
+
+        router = DynamicDbRouter()
+        with routed('test', write=True) as x:
+            self.assertIsInstance(x, routed)
+            self.assertEqual(router.db_for_read(None), 'test')
+            self.assertEqual(router.db_for_write(None), 'test')
+        self.assertEqual(router.db_for_read(None), 'default')
+        with self.assertRaises(ValueError):
+            routed(2)
+
 
 class TestDynamicDatabaseConnection(TestCase):
     def setUp(self):
@@ -80,6 +152,7 @@ class TestDynamicDatabaseConnection(TestCase):
         }
 
     def tearDown(self):
+        in_database.purge_cache()
         os.remove(self.db_filename)
 
     def test_create_db_object(self):
@@ -97,12 +170,112 @@ class TestDynamicDatabaseConnection(TestCase):
         expected_database_name = x.unique_db_id
         self.assertEqual(database_name, expected_database_name)
 
-    def test_cleans_up(self):
+    def test_reuses_identical_config(self):
+        with in_database(self.test_db_config, write=True) as x:
+            G(TestModel, name='Sue')
+        with in_database(dict(self.test_db_config), write=True) as y:
+            count = TestModel.objects.count()
+        self.assertEqual(x.unique_db_id, y.unique_db_id)
+        self.assertTrue(x.created_db_config)
+        self.assertFalse(y.created_db_config)
+        self.assertEqual(count, 1)
+
+    def test_mutating_config_after_use_keeps_registered_settings(self):
+        config = dict(self.test_db_config)
+        with in_database(config) as x:
+            pass
+        config['NAME'] = 'other_' + self.db_filename
+        with in_database(config) as y:
+            pass
+        with in_database(dict(self.test_db_config)) as z:
+            pass
+        self.assertNotEqual(x.unique_db_id, y.unique_db_id)
+        self.assertEqual(x.unique_db_id, z.unique_db_id)
+        self.assertEqual(connections.databases[z.unique_db_id]['NAME'], self.db_filename)
+
+    def test_reuses_config_with_nested_values(self):
+        def config(dependencies, flags):
+            return dict(self.test_db_config, TEST={'DEPENDENCIES': dependencies}, OPTIONS={'flags': flags})
+
+        x = in_database(config(['default'], {('a', 1)}))
+        y = in_database(config(['default'], {('a', 1)}))
+        z = in_database(config(['test'], {('a', 1)}))
+        self.assertEqual(x.unique_db_id, y.unique_db_id)
+        self.assertNotEqual(x.unique_db_id, z.unique_db_id)
+
+    def test_config_with_unhashable_values_is_not_cached(self):
+        starting_connections = len(connections.databases)
+        config = dict(self.test_db_config, OPTIONS={'token': bytearray(b'secret')})
+        x = in_database(config)
+        y = in_database(config)
+        self.assertNotEqual(x.unique_db_id, y.unique_db_id)
+        self.assertTrue(x.created_db_config)
+        self.assertTrue(y.created_db_config)
+        in_database.purge_cache()
+        self.assertEqual(len(connections.databases), starting_connections)
+
+    def test_config_keeps_uncopyable_values(self):
+        context = ssl.create_default_context()
+        config = dict(self.test_db_config, OPTIONS={'ssl': context})
+        x = in_database(config)
+        config['OPTIONS']['timeout'] = 5
+        registered_options = connections.databases[x.unique_db_id]['OPTIONS']
+        self.assertIs(registered_options['ssl'], context)
+        self.assertNotIn('timeout', registered_options)
+
+    async def test_async_reuses_identical_config(self):
+        async with in_database(self.test_db_config) as x:
+            pass
+        async with in_database(self.test_db_config) as y:
+            pass
+        self.assertEqual(x.unique_db_id, y.unique_db_id)
+
+    def test_concurrent_registration_shares_alias(self):
+        def unique_db_id(_):
+            return in_database(dict(self.test_db_config)).unique_db_id
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            unique_db_ids = set(executor.map(unique_db_id, range(32)))
+        self.assertEqual(len(unique_db_ids), 1)
+
+    def test_config_and_alias_instances_are_in_database(self):
+        self.assertIsInstance(in_database(self.test_db_config), in_database)
+        self.assertIsInstance(in_database('test'), in_database)
+        self.assertIsNone(in_database('test').unique_db_id)
+        self.assertFalse(in_database('test').created_db_config)
+
+    def test_registration_rechecks_cache_under_lock(self):
+        existing = in_database(self.test_db_config).unique_db_id
+
+        class RacingCache(dict):
+            # Misses the first lookup, as if another thread registered the
+            # configuration between the unlocked check and taking the lock
+            lookups = 0
+
+            def get(self, key):
+                RacingCache.lookups += 1
+                return None if RacingCache.lookups == 1 else dict.get(self, key)
+
+        with patch.object(router_module, '_CONFIG_CACHE', RacingCache(router_module._CONFIG_CACHE)):
+            x = in_database(self.test_db_config)
+        self.assertEqual(x.unique_db_id, existing)
+        self.assertFalse(x.created_db_config)
+
+    def test_subclass_with_config(self):
+        class routed(in_database):
+            pass
+
+        x = routed(self.test_db_config)
+        self.assertIsInstance(x, routed)
+        self.assertEqual(x.unique_db_id, in_database(self.test_db_config).unique_db_id)
+
+    def test_purge_cache(self):
         starting_connections = len(connections.databases)
         with in_database(self.test_db_config, write=True):
             G(TestModel, name='Sue')
-        ending_connections = len(connections.databases)
-        self.assertEqual(starting_connections, ending_connections)
+        self.assertEqual(len(connections.databases), starting_connections + 1)
+        in_database.purge_cache()
+        self.assertEqual(len(connections.databases), starting_connections)
 
 
 class TestInDatabaseDecorator(TestCase):
@@ -117,6 +290,74 @@ class TestInDatabaseDecorator(TestCase):
         decorator_count = test_db_record_count()
         self.assertEqual(context_count, decorator_count)
 
+    def test_decorator_without_read_or_write_is_noop(self):
+        def count_records():
+            return TestModel.objects.count()
+
+        self.assertIs(in_database('test', read=False, write=False)(count_records), count_records)
+
+    def test_for_alias_shares_instance(self):
+        router = DynamicDbRouter()
+
+        @in_database.for_alias('test', write=True)
+        def routed_dbs():
+            return router.db_for_read(None), router.db_for_write(None)
+
+        self.assertIs(in_database.for_alias('test', write=True), in_database.for_alias('test', write=True))
+        self.assertIsNot(in_database.for_alias('test'), in_database.for_alias('test', write=True))
+        self.assertEqual(routed_dbs(), ('test', 'test'))
+
+    def test_for_alias_is_not_a_context_manager(self):
+        with self.assertRaises(TypeError):
+            with in_database.for_alias('test'):
+                pass
+
+    def test_decorator_is_reentrant(self):
+        router = DynamicDbRouter()
+
+        @in_database('test', write=True)
+        def routed_dbs(depth):
+            if depth:
+                routed_dbs(depth - 1)
+            return router.db_for_read(None), router.db_for_write(None)
+
+        self.assertEqual(routed_dbs(2), ('test', 'test'))
+        self.assertEqual(router.db_for_read(None), 'default')
+        self.assertEqual(router.db_for_write(None), 'default')
+
+
+class TestInDatabaseAsync(TestCase):
+    async def test_async_context_manager(self):
+        router = DynamicDbRouter()
+        async with in_database('test', write=True):
+            self.assertEqual(router.db_for_read(None), 'test')
+            self.assertEqual(router.db_for_write(None), 'test')
+        self.assertEqual(router.db_for_read(None), 'default')
+        self.assertEqual(router.db_for_write(None), 'default')
+
+    async def test_shared_instance_across_tasks(self):
+        router = DynamicDbRouter()
+        shared = in_database('test', write=True)
+
+        async def routed_dbs():
+            async with shared:
+                await asyncio.sleep(0)
+                routed = router.db_for_read(None), router.db_for_write(None)
+            return routed, (router.db_for_read(None), router.db_for_write(None))
+
+        results = await asyncio.gather(routed_dbs(), routed_dbs())
+        self.assertEqual(results, [(('test', 'test'), ('default', 'default'))] * 2)
+
+    async def test_async_decorator(self):
+        router = DynamicDbRouter()
+
+        @in_database('test')
+        async def routed_dbs():
+            return router.db_for_read(None), router.db_for_write(None)
+
+        self.assertEqual(await routed_dbs(), ('test', 'default'))
+        self.assertEqual(router.db_for_read(None), 'default')
+
 
 class TestDynamicDbRouterDefaults(TestCase):
     def test_db_for_read(self):